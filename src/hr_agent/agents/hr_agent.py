@@ -1,10 +1,16 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
+import os
+import random
 import time
 import uuid
-import sys
+from pathlib import Path
+
+import orjson
 from opentelemetry.trace import get_current_span, use_span
+from contextlib import aclosing
 from typing import Optional, AsyncGenerator, Union
 
 from azure.identity.aio import DefaultAzureCredential
@@ -12,31 +18,76 @@ from azure.identity.aio import DefaultAzureCredential
 from semantic_kernel.agents import AzureAIAgent, AzureAIAgentSettings, AzureAIAgentThread
 from semantic_kernel.functions import kernel_function
 
+from hr_agent import semantic_cache, transport
 from hr_agent.config import settings
-from hr_agent.search.retriever import search_hr_chunks
+from hr_agent.search import retriever
+from hr_agent.search.retriever import iter_hr_chunks, search_hr_chunks_async, search_hr_chunks_many
 from hr_agent.telemetry import get_tracer
 from hr_agent.cosmos_thread_store import CosmosThreadStore
 from hr_agent.session_store import SessionStore
 
 tracer = get_tracer("hr-agent.agent")
+logger = logging.getLogger(__name__)
+
+# Streaming events are (kind, value) tuples: cheap to build and to unpack per token
+CHUNK = 0  # value: text delta
+DONE = 1   # value: thread_id (or None)
+StreamEvent = tuple[int, Optional[str]]
+
+# run_id is a trace correlator, not a secret: draw it from a PRNG seeded once from
+# the OS instead of reading os.urandom on every call.
+_rand = random.Random(os.urandom(32))
+
+
+def _run_id() -> str:
+    return uuid.UUID(int=_rand.getrandbits(128), version=4).hex
 
 _cosmos_store = None
 _cached_credential: DefaultAzureCredential | None = None
 _cached_client = None
+_client_lock = asyncio.Lock()
 _cached_agent_definition = None
+_cached_plugin = None
+
+# Upper bound on chunk text handed back to the model per search tool call. Tool output
+# is submitted to the run in one piece, so it is the model's prefill for the answer.
+_TOOL_CHAR_BUDGET = 3600
+
+# Curated FAQ {"question", "answer"} pairs seeded into the semantic cache at warmup
+FAQS_PATH = Path(__file__).resolve().parent.parent / "data" / "faqs.json"
+
+# ChatMessageContent and many SK objects expose `.content`; content items expose `.text`
+_TEXT_ATTRS = ("content", "text", "value")
+_MISSING = object()
+
 
 def _to_text(x) -> str:
     """Coerce SK response content (ChatMessageContent / list / etc.) into plain text."""
-    if x is None:
-        return ""
     if isinstance(x, str):
         return x
-    if isinstance(x, list):
-        return "\n".join(_to_text(i) for i in x)
-    # ChatMessageContent and many SK objects expose `.content`
-    if hasattr(x, "content"):
-        return _to_text(getattr(x, "content"))
-    return str(x)
+    if x is None:
+        return ""
+    # Iterative walk: no recursion per nesting level / list element
+    out: list[str] = []
+    stack = [x]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, str):
+            out.append(v)
+        elif v is None:
+            out.append("")
+        elif isinstance(v, list):
+            stack.extend(reversed(v))
+        else:
+            # The first attribute present wins, even if it is None (rendered as "")
+            for attr in _TEXT_ATTRS:
+                c = getattr(v, attr, _MISSING)
+                if c is not _MISSING:
+                    stack.append(c)
+                    break
+            else:
+                out.append(str(v))
+    return "\n".join(out)
 
 async def get_cosmos_store():
     global _cosmos_store
@@ -44,18 +95,120 @@ async def get_cosmos_store():
         _cosmos_store = CosmosThreadStore.create_from_env()
     return _cosmos_store
 
+def _get_cached_credential() -> DefaultAzureCredential:
+    global _cached_credential
+    if _cached_credential is None:
+        _cached_credential = DefaultAzureCredential()
+    return _cached_credential
+
+
+async def _get_cached_client():
+    """Process-wide Foundry client: the credential chain and TLS setup are paid once."""
+    global _cached_client
+    if _cached_client is not None:
+        return _cached_client
+    async with _client_lock:
+        if _cached_client is None:
+            _cached_client = await AzureAIAgent.create_client(
+                credential=_get_cached_credential(), endpoint=settings.agent_endpoint
+            ).__aenter__()
+    return _cached_client
+
+
+async def warmup() -> None:
+    """
+    Prime the credential, Foundry client, agent definition, Cosmos store and Search
+    client concurrently, and seed the semantic cache with the curated FAQs, so the
+    first question does not pay their one-time setup.
+    Failures are reported but never raised: the request path retries lazily.
+    """
+    async def _agent_definition():
+        await _get_or_create_agent_definition(await _get_cached_client())
+
+    async def _faqs():
+        if FAQS_PATH.exists():
+            raw = await asyncio.to_thread(FAQS_PATH.read_bytes)
+            await semantic_cache.preload(orjson.loads(raw))
+
+    with tracer.start_as_current_span("agent.warmup") as span:
+        t0 = time.perf_counter()
+        steps = {
+            "cosmos": get_cosmos_store(),
+            "agent": _agent_definition(),
+            "search": search_hr_chunks_async("warmup", top=1),
+            "token": _get_cached_credential().get_token("https://cognitiveservices.azure.com/.default"),
+            "faqs": _faqs(),
+        }
+        results = await asyncio.gather(*steps.values(), return_exceptions=True)
+        for name, result in zip(steps, results):
+            if isinstance(result, BaseException):
+                span.record_exception(result)
+                logger.warning("warmup step '%s' failed: %s", name, result)
+        span.set_attribute("warmup_ms", int((time.perf_counter() - t0) * 1000))
+
+
+async def aclose() -> None:
+    """Close the process-wide clients. Call once on shutdown."""
+    global _cosmos_store, _cached_credential, _cached_client, _cached_agent_definition
+    if _cached_client is not None:
+        await _cached_client.close()
+        _cached_client = None
+        _cached_agent_definition = None
+    if _cached_credential is not None:
+        await _cached_credential.close()
+        _cached_credential = None
+    if _cosmos_store is not None:
+        await _cosmos_store.close()
+        _cosmos_store = None
+    await retriever.aclose()
+    await semantic_cache.close()
+    await transport.aclose()
+
+
+def _compact_row(r: dict) -> dict:
+    return {"chunk_id": r["chunk_id"], "file": r["file"], "chunk": (r["chunk"] or "")[:1200]}
+
+
+def _compact(rows: list[dict]) -> list[dict]:
+    return [_compact_row(r) for r in rows]
+
+
 class HRSearchPlugin:
     @kernel_function(
         name="search_hr_chunks",
-        description="Search HR policy chunks in Azure AI Search. Input is a natural-language query."
+        description=(
+            "Search HR policy chunks in Azure AI Search. Input is a natural-language query. "
+            f"Returns up to `top` chunks, stopping early once about {_TOOL_CHAR_BUDGET} "
+            "characters of chunk text have been collected."
+        )
+    )
+    async def search_hr_chunks(self, query: str, top: int = 3) -> str:
+        # Build the tool result as hits arrive and stop reading once the budget is
+        # spent, rather than materialising every result first. The last of `top` rows
+        # never breaks out: letting the search finish is what fills the results cache.
+        compact = []
+        used = 0
+        async with aclosing(iter_hr_chunks(query, top=top)) as rows:
+            async for r in rows:
+                row = _compact_row(r)
+                compact.append(row)
+                used += len(row["chunk"])
+                if used >= _TOOL_CHAR_BUDGET and len(compact) < top:
+                    break
+        return orjson.dumps(compact).decode()
+
+    @kernel_function(
+        name="search_hr_chunks_batch",
+        description=(
+            "Search HR policy chunks for several natural-language queries at once. "
+            "Prefer this over repeated search_hr_chunks calls when a question has multiple parts."
+        )
     )
-    def search_hr_chunks(self, query: str, top: int = 3) -> str:
-        rows = search_hr_chunks(query=query, top=top)
-        compact = [
-            {"chunk_id": r["chunk_id"], "file": r["file"], "chunk": (r["chunk"] or "")[:1200]}
-            for r in rows
-        ]
-        return json.dumps(compact, ensure_ascii=False)
+    async def search_hr_chunks_batch(self, queries: list[str], top: int = 3) -> str:
+        results = await search_hr_chunks_many(queries=queries, top=top)
+        return orjson.dumps(
+            [{"query": q, "chunks": _compact(rows)} for q, rows in zip(queries, results)]
+        ).decode()
 
 
 async def _get_or_create_agent_definition(client):
@@ -81,50 +234,132 @@ async def _get_or_create_agent_definition(client):
     return _cached_agent_definition
 
 
+async def _persist_thread_id(
+    cosmos: CosmosThreadStore,
+    session_id: str,
+    tid: Optional[str],
+    cosmos_tid: Optional[str],
+    reuse_thread: bool,
+) -> None:
+    # Only write to Cosmos if thread ID changed from what's stored. The read and this
+    # write are deliberately not one TransactionalBatch: the read has to finish before
+    # the run starts, and a batch whose read misses fails as a whole (every new session).
+    if reuse_thread and tid and tid != cosmos_tid:
+        await cosmos.upsert_thread_id(session_id, tid)
+
+
+def _record_cache(span, cache: semantic_cache.CacheLookup) -> None:
+    span.set_attribute("semcache.hit", cache.hit)
+    span.set_attribute("semcache.candidates", cache.candidates)
+    span.set_attribute("semcache.false_rejects", cache.rejected)
+
+
+async def _seed_thread(client, question: str, answer: str) -> Optional[str]:
+    """
+    Creates a Foundry thread holding a cache-served exchange, so follow-up questions
+    keep its context. Returns None (no thread) if the thread cannot be created.
+    """
+    with tracer.start_as_current_span("agent.seed_thread") as span:
+        t0 = time.perf_counter()
+        try:
+            thread = await client.agents.threads.create(messages=[
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": answer},
+            ])
+            return thread.id
+        except Exception as e:
+            span.record_exception(e)
+            logger.warning("seeding thread for cached answer failed: %s", e)
+            return None
+        finally:
+            span.set_attribute("seed_thread_ms", int((time.perf_counter() - t0) * 1000))
+
+
+async def _cached_stream(answer: str, finish) -> AsyncGenerator[StreamEvent, None]:
+    # The answer goes out first; the thread is seeded before DONE reports its id
+    yield (CHUNK, answer)
+    yield (DONE, await finish())
+
+
 async def ask(
     question: str,
     thread_id: Optional[str] = None,
     reuse_thread: bool = True,
     stream: bool = False,
     cosmos_tid: Optional[str] = None,
-    session_id: Optional[str] = None
-) -> Union[tuple[str, Optional[str]], AsyncGenerator[dict, None]]:
+    session_id: Optional[str] = None,
+    persist_thread: bool = True,
+) -> Union[tuple[str, Optional[str]], AsyncGenerator[StreamEvent, None]]:
     """
     Ask the HR agent a question.
     
     When stream=False: Returns tuple (answer_text, thread_id_used).
-    When stream=True: Returns async generator yielding dict chunks:
-        - {"type": "chunk", "content": "text"}
-        - {"type": "done", "thread_id": "..."}
+    When stream=True: Returns async generator yielding (kind, value) tuples:
+        - (CHUNK, "text")
+        - (DONE, thread_id)
     
     If reuse_thread=True, we load/save thread_id from Cosmos to skip create_thread overhead next runs.
     If session_id is not provided, it will be loaded from/created in local storage (for CLI mode).
+    persist_thread=False leaves the Cosmos write to the caller (the web app queues it).
+    If the semantic cache is enabled and holds an answer for an equivalent question, the
+    first turn of a conversation is answered from it without running the agent. Follow-ups
+    depend on thread context, so they are neither served from nor stored in the cache.
     """
     # Only use local session store if session_id is not explicitly provided (CLI mode)
     if session_id is None:
-        session_id = SessionStore.default().load_or_create()
+        session_id = await SessionStore.default().load_or_create_async()
     
     cosmos = await get_cosmos_store()
 
-    # Always load cosmos_tid when reuse_thread=True, so we can detect changes
-    if reuse_thread and not thread_id:
-        cosmos_tid = await cosmos.get_thread_id(session_id)
+    # Always load cosmos_tid when reuse_thread=True, so we can detect changes.
+    # The read is independent of client/agent setup, so overlap the two.
+    cosmos_task = (
+        asyncio.create_task(cosmos.get_thread_id(session_id))
+        if reuse_thread and not thread_id
+        else None
+    )
+    # Likewise overlap the cache lookup; it is dropped if the session has a thread
+    cache_task = asyncio.create_task(semantic_cache.lookup(question)) if not thread_id else None
+
+    global _cached_plugin
+    if _cached_plugin is None:
+        _cached_plugin = HRSearchPlugin()
+
+    try:
+        client = await _get_cached_client()
+        agent_definition = await _get_or_create_agent_definition(client)
+    except BaseException:
+        for task in (cosmos_task, cache_task):
+            if task:
+                task.cancel()
+        raise
+
+    if cosmos_task:
+        cosmos_tid = await cosmos_task
         thread_id = cosmos_tid
     else:
         cosmos_tid = None
 
-    global _cached_credential, _cached_client
-    if _cached_credential is None:
-        _cached_credential = DefaultAzureCredential()
-    
-    # Cache the client to avoid closing it
-    if _cached_client is None:
-        _cached_client = await AzureAIAgent.create_client(credential=_cached_credential, endpoint=settings.agent_endpoint).__aenter__()
-    
-    client = _cached_client
-    agent_definition = await _get_or_create_agent_definition(client)
+    fresh_turn = not thread_id
+    if cache_task and not fresh_turn:
+        cache_task.cancel()
+        cache_task = None
+    cache = await cache_task if cache_task else semantic_cache.CacheLookup()
+    if cache.hit:
+        with tracer.start_as_current_span("agent.ask") as span:
+            _record_cache(span, cache)
+
+        async def _finish() -> Optional[str]:
+            tid = await _seed_thread(client, question, cache.answer)
+            await _persist_thread_id(cosmos, session_id, tid, cosmos_tid, reuse_thread and persist_thread)
+            return tid
+
+        if stream:
+            return _cached_stream(cache.answer, _finish)
+        return (cache.answer, await _finish())
+
     # Create fresh agent wrapper with cached definition but current client
-    agent = AzureAIAgent(client=client, definition=agent_definition, plugins=[HRSearchPlugin()])
+    agent = AzureAIAgent(client=client, definition=agent_definition, plugins=[_cached_plugin])
 
     thread = (
         AzureAIAgentThread(client=client, thread_id=thread_id)
@@ -135,6 +370,7 @@ async def ask(
     # Start span manually so it stays open during streaming
     span = tracer.start_span("agent.ask")
     span_ctx = span.get_span_context()
+    _record_cache(span, cache)
     
     # For non-streaming, use context manager as before
     if not stream:
@@ -143,14 +379,14 @@ async def ask(
             span.add_event("start.ask")
 
             span.set_attribute("agent.id", agent.id)
-            run_id = str(uuid.uuid4())
+            run_id = _run_id()
             span.set_attribute("run.id", run_id)
             span.set_attribute("question.len", len(question))
             
-            # print trace_id for easy filtering in portal (take it from THIS span)
+            # log trace_id for easy filtering in portal (take it from THIS span)
             trace_id_hex = format(span_ctx.trace_id, "032x")
-            print(f"[run_id] {run_id}")
-            print(f"[trace_id] {trace_id_hex}")
+            logger.info("[run_id] %s", run_id)
+            logger.info("[trace_id] %s", trace_id_hex)
 
             span.add_event("thread.ready")
 
@@ -167,26 +403,26 @@ async def ask(
             # ✅ thread id is definitive here
             span.set_attribute("thread.id", tid or "")
 
-            # Only write to Cosmos if thread ID changed from what's stored
-            if reuse_thread and tid and tid != cosmos_tid:
-                await cosmos.upsert_thread_id(session_id, tid)
+            await _persist_thread_id(cosmos, session_id, tid, cosmos_tid, reuse_thread and persist_thread)
 
             elapsed_ms = int((time.perf_counter() - t0) * 1000)
             span.set_attribute("agent.elapsed_ms", elapsed_ms)
             answer_text = _to_text(getattr(resp, "content", resp))
+            if fresh_turn:
+                await semantic_cache.store(question, answer_text, tid)
             return (answer_text, tid)
     
     # STREAMING MODE - keep span open during generator consumption
     t_setup0 = time.perf_counter()
     span.add_event("start.ask")
     span.set_attribute("agent.id", agent.id)
-    run_id = str(uuid.uuid4())
+    run_id = _run_id()
     span.set_attribute("run.id", run_id)
     span.set_attribute("question.len", len(question))
     
     trace_id_hex = format(span_ctx.trace_id, "032x")
-    print(f"[run_id] {run_id}")
-    print(f"[trace_id] {trace_id_hex}")
+    logger.info("[run_id] %s", run_id)
+    logger.info("[trace_id] %s", trace_id_hex)
     
     span.add_event("thread.ready")
     t0 = time.perf_counter()
@@ -195,27 +431,31 @@ async def ask(
         try:
             with use_span(span, end_on_exit=False):
                 first_token_ms: Optional[int] = None
+                parts: list[str] = []
                 
-                # Use invoke_stream for true token-level streaming if available
-                # Otherwise fall back to invoke which may yield complete messages
+                # invoke_stream yields token-level deltas; forward each one as soon as it
+                # arrives. Text deltas are plain strings, so only fall back to _to_text
+                # for structured content.
                 async for msg in agent.invoke_stream(messages=question, thread=thread):
-                    text = _to_text(getattr(msg, "content", None))
+                    content = getattr(msg, "content", None)
+                    text = content if isinstance(content, str) else _to_text(content)
                     if text:
                         if first_token_ms is None:
                             first_token_ms = int((time.perf_counter() - t0) * 1000)
                             span.set_attribute("agent.first_token_ms", first_token_ms)
-                        yield {"type": "chunk", "content": text}
+                        parts.append(text)
+                        yield (CHUNK, text)
 
                 elapsed_ms = int((time.perf_counter() - t0) * 1000)
                 span.set_attribute("agent.elapsed_ms", elapsed_ms)
 
                 tid = getattr(thread, "id", None)
                 span.set_attribute("thread.id", tid or "")
-                # Only write to Cosmos if thread ID changed from what's stored
-                if reuse_thread and tid and tid != cosmos_tid:
-                    await cosmos.upsert_thread_id(session_id, tid)
-                
-                yield {"type": "done", "thread_id": tid}
+                await _persist_thread_id(cosmos, session_id, tid, cosmos_tid, reuse_thread and persist_thread)
+
+                if fresh_turn:
+                    await semantic_cache.store(question, "".join(parts), tid)
+                yield (DONE, tid)
         finally:
             # End the span when generator completes or is closed
             span.end()
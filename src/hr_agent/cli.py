@@ -2,9 +2,50 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import logging
+import sys
+import time
+from typing import TextIO
 
 from hr_agent.telemetry import setup_telemetry
-from hr_agent.agents.hr_agent import ask
+from hr_agent.agents.hr_agent import CHUNK, DONE, aclose, ask, warmup
+
+
+class _TokenWriter:
+    """
+    Buffers streamed tokens and writes them to the terminal every `max_tokens` tokens or
+    `max_delay` seconds, whichever comes first, so token cadence is not tied to
+    per-token stdout flushes. A loop timer flushes the tail when the model pauses
+    (e.g. during a tool call). Must be used from inside the running event loop.
+    """
+
+    def __init__(self, out: TextIO, max_tokens: int = 16, max_delay: float = 0.016):
+        self._out = out
+        self._max_tokens = max_tokens
+        self._max_delay = max_delay
+        self._pending: list[str] = []
+        self._last_flush = time.perf_counter()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def write(self, text: str) -> None:
+        self._pending.append(text)
+        if (
+            len(self._pending) >= self._max_tokens
+            or time.perf_counter() - self._last_flush >= self._max_delay
+        ):
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._max_delay, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._out.write("".join(self._pending))
+            self._pending.clear()
+        self._out.flush()
+        self._last_flush = time.perf_counter()
 
 
 async def _main() -> None:
@@ -15,8 +56,23 @@ async def _main() -> None:
     parser.add_argument("--stream", action="store_true", help="Stream the agent response")
     args = parser.parse_args()
 
+    # Surface the agent's [run_id] / [trace_id] lines on the console
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    agent_logger = logging.getLogger("hr_agent")
+    agent_logger.addHandler(handler)
+    agent_logger.setLevel(logging.INFO)
+
     setup_telemetry()
 
+    try:
+        await warmup()
+        await _run(args)
+    finally:
+        await aclose()
+
+
+async def _run(args: argparse.Namespace) -> None:
     if args.stream:
         # Handle streaming response
         stream = await ask(
@@ -26,17 +82,16 @@ async def _main() -> None:
             stream=True,
         )
         
-        print("\n\n=== STREAMING ANSWER ===\n")
-        accumulated = []
+        print("\n\n=== STREAMING ANSWER ===\n", flush=True)
+        writer = _TokenWriter(sys.stdout)
         tid = None
         
-        async for chunk in stream:
-            if chunk["type"] == "chunk":
-                content = chunk["content"]
-                print(content, end="", flush=True)
-                accumulated.append(content)
-            elif chunk["type"] == "done":
-                tid = chunk.get("thread_id")
+        async for kind, value in stream:
+            if kind == CHUNK:
+                writer.write(value)
+            elif kind == DONE:
+                tid = value
+        writer.flush()
         
         print("\n")
         if tid:
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os
-from dataclasses import dataclass
+from functools import cached_property
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,19 +11,82 @@ def _req(name: str) -> str:
         raise RuntimeError(f"Missing required env var: {name}")
     return v
 
-@dataclass(frozen=True)
 class Settings:
+    """
+    Each setting is read (and, if required, validated) on first access and then cached,
+    so importing the package does not require env vars for services that are never used.
+    """
+
     # Telemetry
-    appinsights_connection_string: str | None = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
+    @cached_property
+    def appinsights_connection_string(self) -> str | None:
+        return os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
 
     # Foundry / Agents (classic)
-    agent_endpoint: str = _req("AZURE_AI_AGENT_ENDPOINT")
-    model_deployment: str = _req("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME")
-    agent_id: str | None = os.getenv("FOUNDRY_AGENT_ID")
+    @cached_property
+    def agent_endpoint(self) -> str:
+        return _req("AZURE_AI_AGENT_ENDPOINT")
+
+    @cached_property
+    def model_deployment(self) -> str:
+        return _req("AZURE_AI_AGENT_MODEL_DEPLOYMENT_NAME")
+
+    @cached_property
+    def agent_id(self) -> str | None:
+        return os.getenv("FOUNDRY_AGENT_ID")
 
     # Search
-    search_endpoint: str = _req("AZURE_SEARCH_ENDPOINT")
-    search_index: str = _req("AZURE_SEARCH_INDEX")
-    search_api_key: str | None = os.getenv("AZURE_SEARCH_API_KEY")
+    @cached_property
+    def search_endpoint(self) -> str:
+        return _req("AZURE_SEARCH_ENDPOINT")
+
+    @cached_property
+    def search_index(self) -> str:
+        return _req("AZURE_SEARCH_INDEX")
+
+    @cached_property
+    def search_api_key(self) -> str | None:
+        return os.getenv("AZURE_SEARCH_API_KEY")
+
+    # Semantic cache (Azure OpenAI embeddings)
+    @cached_property
+    def semcache_enabled(self) -> bool:
+        return os.getenv("HR_SEMCACHE_ENABLED", "").lower() in ("1", "true", "yes")
+
+    @cached_property
+    def cache_tau_sim(self) -> float:
+        return float(os.getenv("HR_CACHE_TAU_SIM", "0.85"))
+
+    @cached_property
+    def cache_tau_lsm(self) -> float:
+        return float(os.getenv("HR_CACHE_TAU_LSM", "0.9"))
+
+    @cached_property
+    def cache_judge_deployment(self) -> str:
+        return os.getenv("HR_CACHE_JUDGE_DEPLOYMENT", "gpt-4o-mini")
+
+    @cached_property
+    def cache_redis_url(self) -> str | None:
+        return os.getenv("HR_CACHE_REDIS_URL")
+
+    @cached_property
+    def cache_default_ttl(self) -> int:
+        return int(os.getenv("HR_CACHE_DEFAULT_TTL", "3600"))
+
+    @cached_property
+    def openai_endpoint(self) -> str | None:
+        return os.getenv("AZURE_OPENAI_ENDPOINT")
+
+    @cached_property
+    def openai_api_key(self) -> str | None:
+        return os.getenv("AZURE_OPENAI_API_KEY")
+
+    @cached_property
+    def openai_api_version(self) -> str:
+        return os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+
+    @cached_property
+    def embedding_deployment(self) -> str:
+        return os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
 
 settings = Settings()
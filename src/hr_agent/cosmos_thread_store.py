@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
+from cachetools import LRUCache
 from azure.cosmos.aio import CosmosClient
 from azure.identity.aio import DefaultAzureCredential
 
 from hr_agent.telemetry import get_tracer
+from hr_agent.transport import get_transport
 
 tracer = get_tracer("hr-agent.cosmos")
 
+# Bound on remembered session->thread pairs, matching the web app's thread cache
+_LAST_WRITTEN_MAX = 10_000
+
 
 @dataclass
 class CosmosThreadStore:
@@ -20,6 +26,12 @@ class CosmosThreadStore:
     container_name: str
     credential: DefaultAzureCredential
     client: CosmosClient
+    # session_id -> thread_id known to be stored, so unchanged pairs are not rewritten.
+    # LRU-bounded: the web process lives long and sees an unbounded number of sessions.
+    _last_written: LRUCache = field(
+        default_factory=lambda: LRUCache(maxsize=_LAST_WRITTEN_MAX), repr=False
+    )
+    _last_written_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
 
     @staticmethod
     def from_env() -> "CosmosThreadStore":
@@ -32,7 +44,7 @@ class CosmosThreadStore:
         container_name = os.environ["COSMOS_CONTAINER"]
 
         cred = DefaultAzureCredential()
-        client = CosmosClient(endpoint, credential=cred)
+        client = CosmosClient(endpoint, credential=cred, transport=get_transport())
 
         return CosmosThreadStore(
             endpoint=endpoint,
@@ -42,9 +54,19 @@ class CosmosThreadStore:
             client=client,
         )
 
+    async def _remember(self, session_id: str, thread_id: Optional[str]) -> None:
+        if not thread_id:
+            return
+        async with self._last_written_lock:
+            self._last_written[session_id] = thread_id
+
     def _container(self):
         return self.client.get_database_client(self.db_name).get_container_client(self.container_name)
 
+    async def warmup(self) -> None:
+        """Open the TCP/TLS session and fetch account metadata with a cheap point read."""
+        await self.get_thread_id("__warmup__")
+
     async def close(self) -> None:
         await self.client.close()
         await self.credential.close()
@@ -56,6 +78,7 @@ class CosmosThreadStore:
             try:
                 doc = await self._container().read_item(item=session_id, partition_key=session_id)
                 tid = doc.get("thread_id")
+                await self._remember(session_id, tid)
                 return tid
             except Exception:
                 return None
@@ -66,6 +89,11 @@ class CosmosThreadStore:
         with tracer.start_as_current_span("cosmos.upsert_thread_id") as span:
             span.set_attribute("session_id", session_id)
             span.set_attribute("thread_id", thread_id)
+            async with self._last_written_lock:
+                unchanged = self._last_written.get(session_id) == thread_id
+            span.set_attribute("cosmos.skipped", unchanged)
+            if unchanged:
+                return
             t0 = time.perf_counter()
             try:
                 await self._container().upsert_item({
@@ -73,5 +101,28 @@ class CosmosThreadStore:
                     "session_id": session_id,
                     "thread_id": thread_id,
                 })
+                await self._remember(session_id, thread_id)
             finally:
                 span.set_attribute("cosmos.upsert_ms", int((time.perf_counter() - t0) * 1000))
+
+    async def upsert_many(self, pairs: dict[str, str]) -> None:
+        """
+        Upserts several session->thread mappings concurrently. Each session is its own
+        partition, so they cannot share a transactional batch; they share one burst of
+        requests on the pooled connection instead. Raises the first failure, if any,
+        after every write has been attempted.
+        """
+        if len(pairs) == 1:
+            (session_id, thread_id), = pairs.items()
+            await self.upsert_thread_id(session_id, thread_id)
+            return
+        with tracer.start_as_current_span("cosmos.upsert_many") as span:
+            span.set_attribute("cosmos.batch_size", len(pairs))
+            results = await asyncio.gather(
+                *(self.upsert_thread_id(s, t) for s, t in pairs.items()),
+                return_exceptions=True,
+            )
+            errors = [r for r in results if isinstance(r, BaseException)]
+            span.set_attribute("cosmos.failed", len(errors))
+            if errors:
+                raise errors[0]
@@ -0,0 +1,16 @@
+from __future__ import annotations
+import re
+import string
+import unicodedata
+
+# ASCII punctuation plus the marks common in Spanish HR questions (¿Cuántos...?)
+_PUNCT_TABLE = str.maketrans({c: " " for c in string.punctuation + "¿¡«»“”‘’…–—"})
+_WS_RE = re.compile(r"\s+")
+
+def normalize_query(q: str) -> str:
+    """
+    Canonical form of a user question for cache keys and embeddings: NFKC, lowercase,
+    punctuation dropped, whitespace collapsed.
+    """
+    q = unicodedata.normalize("NFKC", q).lower().translate(_PUNCT_TABLE)
+    return _WS_RE.sub(" ", q).strip()
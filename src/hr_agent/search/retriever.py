@@ -1,28 +1,89 @@
 from __future__ import annotations
-from typing import List, Dict
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, List, Dict
 
+from cachetools import TTLCache
 from azure.core.credentials import AzureKeyCredential
 from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
 from azure.search.documents import SearchClient  # 
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 
 from hr_agent.config import settings
+from hr_agent.normalize import normalize_query
 from hr_agent.telemetry import get_tracer
+from hr_agent.transport import get_transport
 
 tracer = get_tracer("hr-agent.search")
 
+_SELECT = ["chunk_id", "parent_id", "chunk", "metadata_storage_name", "metadata_storage_path"]
+
 # Cache the SearchClient to avoid recreation overhead
 _search_client: SearchClient | None = None
+_search_client_lock = threading.Lock()
+
+# Async twin used from the agent path, so tool calls do not block the event loop
+_async_search_client: AsyncSearchClient | None = None
+_async_credential: AsyncDefaultAzureCredential | None = None
+_async_search_client_lock = asyncio.Lock()
+
+# Tool-reasoning loops and different users often repeat the same query; keep results
+# keyed by the normalized query so repeats skip Azure Search.
+_results_cache: TTLCache = TTLCache(maxsize=2048, ttl=600)
+_results_cache_lock = asyncio.Lock()
 
 def _client() -> SearchClient:
     global _search_client
     if _search_client is None:
-        if settings.search_api_key:
-            cred = AzureKeyCredential(settings.search_api_key)
-        else:
-            cred = DefaultAzureCredential()
-        _search_client = SearchClient(endpoint=settings.search_endpoint, index_name=settings.search_index, credential=cred)
+        with _search_client_lock:
+            if _search_client is None:
+                if settings.search_api_key:
+                    cred = AzureKeyCredential(settings.search_api_key)
+                else:
+                    cred = DefaultAzureCredential()
+                _search_client = SearchClient(endpoint=settings.search_endpoint, index_name=settings.search_index, credential=cred)
     return _search_client
 
+async def _async_client() -> AsyncSearchClient:
+    global _async_search_client, _async_credential
+    if _async_search_client is None:
+        async with _async_search_client_lock:
+            if _async_search_client is None:
+                if settings.search_api_key:
+                    cred = AzureKeyCredential(settings.search_api_key)
+                else:
+                    cred = _async_credential = AsyncDefaultAzureCredential()
+                _async_search_client = AsyncSearchClient(
+                    endpoint=settings.search_endpoint,
+                    index_name=settings.search_index,
+                    credential=cred,
+                    transport=get_transport(),
+                )
+    return _async_search_client
+
+async def aclose() -> None:
+    global _async_search_client, _async_credential
+    if _async_search_client is not None:
+        await _async_search_client.close()
+        _async_search_client = None
+    if _async_credential is not None:
+        await _async_credential.close()
+        _async_credential = None
+
+def _cache_key(query: str, top: int) -> str:
+    return hashlib.sha256(f"{normalize_query(query)}|{top}".encode("utf-8")).hexdigest()
+
+def _row(r) -> Dict:
+    return {
+        "chunk_id": r.get("chunk_id"),
+        "parent_id": r.get("parent_id"),
+        "chunk": r.get("chunk"),
+        "file": r.get("metadata_storage_name"),
+        "path": r.get("metadata_storage_path"),
+    }
+
 def search_hr_chunks(query: str, top: int = 3) -> List[Dict]:
     """
     Returns top chunk-documents from Azure AI Search for the given query.
@@ -32,21 +93,64 @@ def search_hr_chunks(query: str, top: int = 3) -> List[Dict]:
         span.set_attribute("search.top", top)
 
         client = _client()
-        results = client.search(
-            search_text=query,
-            top=top,
-            select=["chunk_id", "parent_id", "chunk", "metadata_storage_name", "metadata_storage_path"],
-        )
+        results = client.search(search_text=query, top=top, select=_SELECT)
 
-        rows: List[Dict] = []
-        for r in results:
-            rows.append({
-                "chunk_id": r.get("chunk_id"),
-                "parent_id": r.get("parent_id"),
-                "chunk": r.get("chunk"),
-                "file": r.get("metadata_storage_name"),
-                "path": r.get("metadata_storage_path"),
-            })
+        rows: List[Dict] = [_row(r) for r in results]
 
         span.set_attribute("search.returned", len(rows))
         return rows
+
+async def iter_hr_chunks(query: str, top: int = 3) -> AsyncIterator[Dict]:
+    """
+    Yields chunk-documents page by page as Azure AI Search returns them, so callers can
+    start using the best hits and stop early without waiting for the full result set.
+    Fully consumed results are cached for 10 minutes per normalized (query, top).
+    """
+    span = tracer.start_span("tool.search_hr_chunks")
+    span.set_attribute("search.query", query)
+    span.set_attribute("search.top", top)
+    returned = 0
+    try:
+        key = _cache_key(query, top)
+        async with _results_cache_lock:
+            cached = _results_cache.get(key)
+        if cached is not None:
+            span.set_attribute("x-cache", "HIT")
+            for row in cached:
+                returned += 1
+                yield row
+            return
+        span.set_attribute("x-cache", "MISS")
+
+        client = await _async_client()
+        results = await client.search(search_text=query, top=top, select=_SELECT)
+
+        rows: List[Dict] = []
+        async for page in results.by_page():
+            async for r in page:
+                row = _row(r)
+                rows.append(row)
+                returned += 1
+                yield row
+
+        async with _results_cache_lock:
+            _results_cache[key] = rows
+    finally:
+        span.set_attribute("search.returned", returned)
+        span.end()
+
+async def search_hr_chunks_async(query: str, top: int = 3) -> List[Dict]:
+    """
+    Async variant of search_hr_chunks, sharing one aio SearchClient across calls.
+    """
+    return [row async for row in iter_hr_chunks(query, top=top)]
+
+async def search_hr_chunks_many(queries: List[str], top: int = 3) -> List[List[Dict]]:
+    """
+    Runs several queries concurrently over the shared aio SearchClient.
+    Results are returned in the same order as `queries`.
+    """
+    with tracer.start_as_current_span("tool.search_hr_chunks_many") as span:
+        span.set_attribute("search.queries", len(queries))
+        span.set_attribute("search.top", top)
+        return list(await asyncio.gather(*(search_hr_chunks_async(q, top=top) for q in queries)))
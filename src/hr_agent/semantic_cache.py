@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+from openai import AsyncAzureOpenAI
+from redis.asyncio import Redis
+from redis.commands.search.field import VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from redis.exceptions import ResponseError
+
+from hr_agent.config import settings
+from hr_agent.normalize import normalize_query
+from hr_agent.telemetry import get_tracer
+
+tracer = get_tracer("hr-agent.semcache")
+
+EMBED_DIM = 1536
+INDEX_NAME = "hr_cache_idx"
+KEY_PREFIX = "hrcache:"
+CANDIDATES_K = 3
+
+# Entries live in Azure Managed Redis (RediSearch HNSW index, cosine distance) so the
+# cache survives restarts and is shared by the CLI and every web worker. Expiry is a
+# per-key TTL; capacity eviction is left to the instance's maxmemory policy.
+_KNN_QUERY = (
+    Query(f"*=>[KNN {CANDIDATES_K} @embedding $v AS score]")
+    .sort_by("score")
+    .return_fields("prompt_text", "answer", "thread_id", "score")
+    .dialect(2)
+)
+
+# Second stage: neighbours in embedding space are not necessarily the same question
+# ("vacation policy" vs "sick leave policy"), so each candidate is confirmed by a
+# small model before its answer is served.
+_JUDGE_INSTRUCTIONS = (
+    "You decide whether a cached answer fully and correctly answers a new HR question. "
+    "Reply with exactly one word: yes or no."
+)
+
+
+@dataclass
+class CacheLookup:
+    answer: Optional[str] = None
+    candidates: int = 0
+    rejected: int = 0
+
+    @property
+    def hit(self) -> bool:
+        return self.answer is not None
+
+# lookup() and store() are called back-to-back for the same question; keep the
+# most recent embeddings so a miss followed by a store only embeds once.
+_recent_embeddings: OrderedDict[str, np.ndarray] = OrderedDict()
+_RECENT_MAX = 64
+
+_openai_client: AsyncAzureOpenAI | None = None
+_openai_credential: DefaultAzureCredential | None = None
+_redis_client: Redis | None = None
+_index_ready = False
+
+
+def _client() -> AsyncAzureOpenAI:
+    global _openai_client, _openai_credential
+    if _openai_client is None:
+        if not settings.openai_endpoint:
+            raise RuntimeError("Missing required env var: AZURE_OPENAI_ENDPOINT")
+        if settings.openai_api_key:
+            _openai_client = AsyncAzureOpenAI(
+                azure_endpoint=settings.openai_endpoint,
+                api_key=settings.openai_api_key,
+                api_version=settings.openai_api_version,
+            )
+        else:
+            _openai_credential = DefaultAzureCredential()
+            token_provider = get_bearer_token_provider(
+                _openai_credential, "https://cognitiveservices.azure.com/.default"
+            )
+            _openai_client = AsyncAzureOpenAI(
+                azure_endpoint=settings.openai_endpoint,
+                azure_ad_token_provider=token_provider,
+                api_version=settings.openai_api_version,
+            )
+    return _openai_client
+
+
+async def _redis() -> Redis:
+    global _redis_client, _index_ready
+    if _redis_client is None:
+        if not settings.cache_redis_url:
+            raise RuntimeError("Missing required env var: HR_CACHE_REDIS_URL")
+        _redis_client = Redis.from_url(settings.cache_redis_url)
+
+    if not _index_ready:
+        try:
+            await _redis_client.ft(INDEX_NAME).info()
+        except ResponseError:
+            await _redis_client.ft(INDEX_NAME).create_index(
+                fields=[
+                    VectorField(
+                        "embedding",
+                        "HNSW",
+                        {"TYPE": "FLOAT32", "DIM": EMBED_DIM, "DISTANCE_METRIC": "COSINE"},
+                    )
+                ],
+                definition=IndexDefinition(prefix=[KEY_PREFIX], index_type=IndexType.HASH),
+            )
+        _index_ready = True
+    return _redis_client
+
+
+def _key(question: str) -> str:
+    return KEY_PREFIX + hashlib.sha256(normalize_query(question).encode("utf-8")).hexdigest()
+
+
+async def _embed(question: str) -> np.ndarray:
+    # Embed the canonical form so trivial variations land on the same vector
+    text = normalize_query(question)
+    vec = _recent_embeddings.get(text)
+    if vec is not None:
+        _recent_embeddings.move_to_end(text)
+        return vec
+
+    resp = await _client().embeddings.create(model=settings.embedding_deployment, input=text)
+    vec = np.asarray(resp.data[0].embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    if norm:
+        vec /= norm
+
+    _recent_embeddings[text] = vec
+    if len(_recent_embeddings) > _RECENT_MAX:
+        _recent_embeddings.popitem(last=False)
+    return vec
+
+
+async def _embed_many(questions: list[str]) -> list[np.ndarray]:
+    """Embeds all questions with a single embeddings request."""
+    texts = [normalize_query(q) for q in questions]
+    resp = await _client().embeddings.create(model=settings.embedding_deployment, input=texts)
+    vecs = []
+    for item in sorted(resp.data, key=lambda d: d.index):
+        vec = np.asarray(item.embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+        vecs.append(vec)
+    return vecs
+
+
+async def _judge(question: str, cached_question: str, cached_answer: str) -> float:
+    """Returns the judge's probability that `cached_answer` answers `question`."""
+    resp = await _client().chat.completions.create(
+        model=settings.cache_judge_deployment,
+        messages=[
+            {"role": "system", "content": _JUDGE_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": (
+                    f"New question: {question}\n\n"
+                    f"Cached question: {cached_question}\n\n"
+                    f"Cached answer: {cached_answer}"
+                ),
+            },
+        ],
+        max_tokens=1,
+        temperature=0,
+        logprobs=True,
+        top_logprobs=5,
+    )
+    logprobs = resp.choices[0].logprobs
+    if not logprobs or not logprobs.content:
+        return 0.0
+    return sum(
+        math.exp(t.logprob)
+        for t in logprobs.content[0].top_logprobs
+        if t.token.strip().lower() == "yes"
+    )
+
+
+async def lookup(question: str) -> CacheLookup:
+    """
+    Returns a cached answer for a semantically equivalent question (`answer` is None on miss).
+
+    Candidates are recalled from the HNSW index at HR_CACHE_TAU_SIM and then validated
+    in parallel by the judge model at HR_CACHE_TAU_LSM.
+    Never raises: any embedding, Redis or judge failure is treated as a miss.
+    """
+    result = CacheLookup()
+    if not settings.semcache_enabled:
+        return result
+
+    with tracer.start_as_current_span("semcache.lookup") as span:
+        t0 = time.perf_counter()
+        try:
+            r = await _redis()
+            q = await _embed(question)
+            res = await r.ft(INDEX_NAME).search(_KNN_QUERY, query_params={"v": q.tobytes()})
+
+            # COSINE in RediSearch is a distance: 1 - cosine similarity
+            candidates = [d for d in res.docs if 1.0 - float(d.score) >= settings.cache_tau_sim]
+            result.candidates = len(candidates)
+            if res.docs:
+                span.set_attribute("semcache.top_score", 1.0 - float(res.docs[0].score))
+            if not candidates:
+                return result
+
+            scores = await asyncio.gather(*(_judge(question, d.prompt_text, d.answer) for d in candidates))
+            best = max(range(len(candidates)), key=scores.__getitem__)
+            span.set_attribute("semcache.lsm_score", scores[best])
+
+            accepted = [i for i, s in enumerate(scores) if s >= settings.cache_tau_lsm]
+            result.rejected = len(candidates) - len(accepted)
+            if scores[best] >= settings.cache_tau_lsm:
+                result.answer = candidates[best].answer
+            return result
+        except Exception as e:
+            span.record_exception(e)
+            return result
+        finally:
+            span.set_attribute("semcache.hit", result.hit)
+            span.set_attribute("semcache.candidates", result.candidates)
+            span.set_attribute("semcache.false_rejects", result.rejected)
+            span.set_attribute("semcache.lookup_ms", int((time.perf_counter() - t0) * 1000))
+
+
+async def store(question: str, answer: str, thread_id: Optional[str] = None) -> None:
+    """Caches `answer` for `question` with the default TTL. Failures are recorded and ignored."""
+    if not settings.semcache_enabled or not answer:
+        return
+
+    with tracer.start_as_current_span("semcache.store") as span:
+        try:
+            r = await _redis()
+            q = await _embed(question)
+            key = _key(question)
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={
+                    "embedding": q.tobytes(),
+                    "prompt_text": question,
+                    "answer": answer,
+                    "thread_id": thread_id or "",
+                    "created_at": int(time.time()),
+                })
+                pipe.expire(key, settings.cache_default_ttl)
+                await pipe.execute()
+        except Exception as e:
+            span.record_exception(e)
+
+
+async def preload(pairs: Iterable[dict]) -> int:
+    """
+    Seeds the cache with curated {"question", "answer"} pairs. FAQ entries never expire,
+    since they are only seeded at startup. Entries whose cached answer already matches
+    are left alone; new or edited ones are embedded in one batched request and
+    overwritten. Returns the number stored.
+    """
+    if not settings.semcache_enabled:
+        return 0
+
+    with tracer.start_as_current_span("semcache.preload") as span:
+        try:
+            pairs = [p for p in pairs if p.get("question") and p.get("answer")]
+            if not pairs:
+                return 0
+            r = await _redis()
+            keys = [_key(p["question"]) for p in pairs]
+            async with r.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hget(key, "answer")
+                cached = await pipe.execute()
+            stale = [
+                (k, p) for k, p, answer in zip(keys, pairs, cached)
+                if answer is None or answer.decode("utf-8") != p["answer"]
+            ]
+            span.set_attribute("semcache.preload_skipped", len(pairs) - len(stale))
+
+            vecs = await _embed_many([p["question"] for _, p in stale]) if stale else []
+            now = int(time.time())
+            async with r.pipeline(transaction=False) as pipe:
+                for (key, p), vec in zip(stale, vecs):
+                    pipe.hset(key, mapping={
+                        "embedding": vec.tobytes(),
+                        "prompt_text": p["question"],
+                        "answer": p["answer"],
+                        "thread_id": "",
+                        "created_at": now,
+                    })
+                # Also clears a TTL left by a runtime store() of the same question
+                for key in keys:
+                    pipe.persist(key)
+                await pipe.execute()
+            span.set_attribute("semcache.preloaded", len(stale))
+            return len(stale)
+        except Exception as e:
+            span.record_exception(e)
+            return 0
+
+
+async def close() -> None:
+    global _redis_client, _index_ready, _openai_client, _openai_credential
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+        _index_ready = False
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    if _openai_credential is not None:
+        await _openai_credential.close()
+        _openai_credential = None
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import asyncio
+import functools
 from dataclasses import dataclass
 from pathlib import Path
 import uuid
@@ -9,6 +11,7 @@ class SessionStore:
     path: Path
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def default() -> "SessionStore":
         state_dir = Path.cwd() / ".state"
         state_dir.mkdir(parents=True, exist_ok=True)
@@ -22,3 +25,7 @@ class SessionStore:
         sid = f"session_{uuid.uuid4().hex}"
         self.path.write_text(sid, encoding="utf-8")
         return sid
+
+    async def load_or_create_async(self) -> str:
+        """load_or_create() run in a worker thread, for callers on the event loop."""
+        return await asyncio.to_thread(self.load_or_create)
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import asyncio
+import functools
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
@@ -8,6 +10,7 @@ class ThreadStore:
     path: Path
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def default() -> "ThreadStore":
         # Store under project root (current working dir)
         state_dir = Path.cwd() / ".state"
@@ -24,3 +27,9 @@ class ThreadStore:
         if not thread_id:
             return
         self.path.write_text(thread_id, encoding="utf-8")
+
+    async def load_async(self) -> Optional[str]:
+        return await asyncio.to_thread(self.load)
+
+    async def save_async(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.save, thread_id)
@@ -0,0 +1,30 @@
+from __future__ import annotations
+from typing import Optional
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+# One connection pool for every async Azure SDK client in the process (Search, Cosmos),
+# so tool calls and thread reads/writes reuse warm TCP+TLS connections.
+POOL_LIMIT = 50
+
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_transport() -> AioHttpTransport:
+    """
+    Returns an azure-core transport bound to the shared aiohttp session.
+    Must be called from inside a running event loop.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_LIMIT, keepalive_timeout=60),
+        )
+    # session_owner=False: closing one client must not close the pool for the others
+    return AioHttpTransport(session=_session, session_owner=False)
+
+async def aclose() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
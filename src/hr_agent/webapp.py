@@ -1,187 +1,462 @@
 import asyncio
+import logging
+import os
 import time
 import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, cast, AsyncGenerator
+from typing import Optional, AsyncGenerator
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.encoders import jsonable_encoder
+import orjson
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
 
 
-from hr_agent.agents.hr_agent import ask
+from hr_agent.agents.hr_agent import CHUNK, DONE, StreamEvent, aclose, ask, warmup
 from hr_agent.telemetry import setup_telemetry
 from hr_agent.cosmos_thread_store import CosmosThreadStore
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Singleton Cosmos store (AAD / DefaultAzureCredential version you already use)
-cosmos: CosmosThreadStore | None = None
+CHAT_HTML_PATH = Path(__file__).parent / "web" / "chat.html"
 
-@app.on_event("startup")
-async def _startup():
-    global cosmos
+# session_id -> (thread_id, monotonic expiry), most recently used last. Saves the
+# Cosmos read when a client reconnects; the TTL bounds staleness across workers.
+_thread_cache: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+_thread_cache_lock = asyncio.Lock()
+_THREAD_CACHE_MAX = 10_000
+_THREAD_CACHE_TTL = 300.0
+
+# Thread-id writes are idempotent and last-writer-wins, so they are queued and flushed
+# in the background instead of delaying the next turn. A None item stops the worker.
+_UPSERT_BATCH_MAX = 32
+_UPSERT_BATCH_WINDOW = 0.05
+
+
+async def _upsert_worker(store: CosmosThreadStore, q: "asyncio.Queue[Optional[tuple[str, str]]]") -> None:
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await q.get()
+        if item is None:
+            return
+        # Collect up to _UPSERT_BATCH_MAX writes or _UPSERT_BATCH_WINDOW seconds,
+        # keeping only the latest thread_id per session
+        batch = {item[0]: item[1]}
+        taken = 1
+        deadline = loop.time() + _UPSERT_BATCH_WINDOW
+        while taken < _UPSERT_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(q.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch[item[0]] = item[1]
+            taken += 1
+        try:
+            await store.upsert_many(batch)
+        except Exception as e:
+            logger.warning("background thread_id upsert failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Process startup/shutdown: everything a request needs is created and warmed here,
+    then exposed on app.state (cosmos, upsert_q, chat_html).
+    """
     setup_telemetry()
-    cosmos = CosmosThreadStore.create_from_env()
-
-@app.on_event("shutdown")
-async def _shutdown():
-    global cosmos
-    if cosmos is not None:
-        await cosmos.close()
-        cosmos = None
+    # chat.html never changes at runtime: read it once
+    app.state.chat_html = CHAT_HTML_PATH.read_bytes()
+
+    # Singleton Cosmos store (AAD / DefaultAzureCredential version you already use)
+    store = CosmosThreadStore.create_from_env()
+    upsert_q: "asyncio.Queue[Optional[tuple[str, str]]]" = asyncio.Queue()
+    upsert_task = asyncio.create_task(_upsert_worker(store, upsert_q))
+    app.state.cosmos = store
+    app.state.upsert_q = upsert_q
+
+    # Open the Cosmos connection and prime the agent-side clients concurrently. A cold
+    # connection only costs the first request some latency, so failures are logged.
+    cosmos_warm, _ = await asyncio.gather(store.warmup(), warmup(), return_exceptions=True)
+    if isinstance(cosmos_warm, Exception):
+        logger.warning("cosmos warmup failed: %s", cosmos_warm)
+    try:
+        yield
+    finally:
+        # Flush queued thread_id writes before the store goes away
+        upsert_q.put_nowait(None)
+        await upsert_task
+        await store.close()
+        # Also closes the shared aiohttp transport
+        await aclose()
 
 
-CHAT_HTML_PATH = Path(__file__).parent / "web" / "chat.html"
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
-async def index():
-    return HTMLResponse(CHAT_HTML_PATH.read_text(encoding="utf-8"))
+async def index(request: Request):
+    return Response(
+        content=request.app.state.chat_html,
+        media_type="text/html; charset=utf-8",
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
+
+
+AGENT_NAME = "hr_agent"
+
+# Debug frames sent to the client's debug panel: 0 = none, 1 = info/errors (default),
+# 3 = also echo each complete answer back (the largest frame, truncated to
+# _DEBUG_ANSWER_MAX chars).
+DEBUG_LEVEL = int(os.getenv("HR_AGENT_DEBUG", "1"))
+_DEBUG_ANSWER_MAX = 2000
+
+
+def _envelope(frame_type: str) -> bytes:
+    """Pre-serialized `{"type":...,"message_id":` head shared by every frame of that type."""
+    return b'{"type":' + orjson.dumps(frame_type) + b',"message_id":'
+
+
+_STREAM_START = _envelope("stream_start")
+_STREAM_END = _envelope("stream_end")
+_STREAM_ERROR = _envelope("stream_error")
+
+
+def _send_framed(ws: WebSocket, head: bytes, message_id: str, tail: dict):
+    """Send head + message_id + the (non-empty) `tail` fields as one JSON object."""
+    return ws.send_bytes(head + orjson.dumps(message_id) + b"," + orjson.dumps(tail, default=str)[1:])
 
 
-async def send_debug(ws: WebSocket, log_type: str, message: str, data=None):
-    payload = {
+def _send_error(ws: WebSocket, message_id: str, error: str):
+    """stream_error frame for both turn modes: the template plus one orjson call per field."""
+    return ws.send_bytes(
+        _STREAM_ERROR + orjson.dumps(message_id) + b',"error":' + orjson.dumps(error) + b"}"
+    )
+
+
+def _send(ws: WebSocket, obj):
+    """
+    Encode with orjson and send as a binary frame (the client decodes UTF-8 JSON).
+    Payloads are plain dicts of JSON-native values with str keys; `default=str` only
+    guards against a stray SDK object and costs nothing otherwise.
+    """
+    return ws.send_bytes(orjson.dumps(obj, default=str))
+
+
+# The loop only keeps weak references to tasks: fire-and-forget sends are held here
+# until they finish
+_background_tasks: "set[asyncio.Task]" = set()
+
+
+def _on_background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("background send failed: %s", task.exception())
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+async def _get_cached_thread_id(session_id: str) -> Optional[str]:
+    async with _thread_cache_lock:
+        entry = _thread_cache.get(session_id)
+        if entry is None:
+            return None
+        tid, expires = entry
+        if expires < time.monotonic():
+            del _thread_cache[session_id]
+            return None
+        _thread_cache.move_to_end(session_id)
+        return tid
+
+
+async def _cache_thread_id(session_id: str, thread_id: Optional[str]) -> None:
+    if not thread_id:
+        return
+    async with _thread_cache_lock:
+        _thread_cache[session_id] = (thread_id, time.monotonic() + _THREAD_CACHE_TTL)
+        _thread_cache.move_to_end(session_id)
+        while len(_thread_cache) > _THREAD_CACHE_MAX:
+            _thread_cache.popitem(last=False)
+
+
+def send_debug(debug_q: "asyncio.Queue[bytes]", log_type: str, message: str, data=None, level: int = 1) -> None:
+    """
+    Queue a debug_log frame for the connection's background writer; never blocks.
+    Frames above DEBUG_LEVEL are dropped before anything is encoded.
+    `data` must already be JSON-native (str/int/float/bool/None, lists and str-keyed
+    dicts of those): it is serialized as-is, with no encoder pass.
+    When the queue is full the oldest frame is dropped, so debug output never
+    backpressures the agent.
+    """
+    if DEBUG_LEVEL < level:
+        return
+    frame = orjson.dumps({
         "type": "debug_log",
         "log_type": log_type,
         "message": message,
         "data": data or {},
-    }
-    await ws.send_json(jsonable_encoder(payload))
+    }, default=str)
+    try:
+        debug_q.put_nowait(frame)
+    except asyncio.QueueFull:
+        debug_q.get_nowait()
+        debug_q.put_nowait(frame)
+
+
+async def _drain(ws: WebSocket, debug_q: "asyncio.Queue[bytes]") -> None:
+    """Single writer for a connection's debug frames, off the request's critical path."""
+    try:
+        while True:
+            frame = await debug_q.get()
+            await ws.send_bytes(frame)
+    except (WebSocketDisconnect, RuntimeError):
+        # Socket closed underneath us; the endpoint cancels this task on its way out
+        return
+
+
+async def _receive_payload(ws: WebSocket) -> dict:
+    """
+    Read one client message and parse it with orjson. Works for text and binary frames
+    alike (orjson accepts str and bytes), so there is no per-connection mode to detect.
+    """
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    raw = message.get("bytes")
+    if raw is None:
+        raw = message.get("text") or "{}"
+    return orjson.loads(raw)
+
+
+class _ChunkBatcher:
+    """
+    Coalesces stream chunks into `stream_chunk_batch` frames: a frame is sent once
+    `max_items` chunks are pending or `max_delay` seconds have passed since the last one,
+    with a timer so a trailing chunk is never held back longer than `max_delay`.
+    """
+
+    def __init__(self, ws: WebSocket, message_id: str, max_items: int = 16, max_delay: float = 0.02):
+        self._ws = ws
+        # Only `contents` varies per frame: serialize the envelope around it once
+        self._prefix = (
+            b'{"type":"stream_chunk_batch","message_id":' + orjson.dumps(message_id) + b',"contents":'
+        )
+        self._max_items = max_items
+        self._max_delay = max_delay
+        self._max_delay_ns = int(max_delay * 1_000_000_000)
+        self._pending: list[str] = []
+        self._last_flush = time.perf_counter_ns()
+        # Serializes flushes so frames from the timer and the stream loop stay in order
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+    async def add(self, content: str) -> None:
+        self._pending.append(content)
+        if (
+            len(self._pending) >= self._max_items
+            or time.perf_counter_ns() - self._last_flush >= self._max_delay_ns
+        ):
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._max_delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        async with self._lock:
+            self._cancel_timer()
+            if not self._pending:
+                return
+            contents, self._pending = self._pending, []
+            self._last_flush = time.perf_counter_ns()
+            await self._ws.send_bytes(self._prefix + orjson.dumps(contents) + b"}")
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._timer_task is not None:
+            await self._timer_task
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def cancel(self) -> None:
+        """Drop the pending timer and any timer-driven flush (error path)."""
+        self._cancel_timer()
+        task, self._timer_task = self._timer_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Retrieve a failed flush (e.g. the socket closed) so it is not reported
+            # as "Task exception was never retrieved"
+            task.exception()
 
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
+    # Bind the process singletons once: local loads in the turn loop, and a check that
+    # is not stripped under `python -O`
+    store: Optional[CosmosThreadStore] = getattr(ws.app.state, "cosmos", None)
+    upsert_q = getattr(ws.app.state, "upsert_q", None)
+    if store is None or upsert_q is None:
+        raise RuntimeError("Cosmos not initialized")
+
     await ws.accept()
 
-    assert cosmos is not None, "Cosmos store not initialized"
+    # message_id only correlates frames of one turn within this page, so a short
+    # per-connection prefix plus a turn counter is enough (and smaller on the wire)
+    conn_id = uuid.uuid4().hex[:8]
+    msg_seq = 0
+
+    debug_q: asyncio.Queue[bytes] = asyncio.Queue(maxsize=256)
+    writer_task = asyncio.create_task(_drain(ws, debug_q))
 
     session_id = ws.query_params.get("session_id") or "session_unknown"
-    await send_debug(ws, "info", "Session started", {"session_id": session_id})
+    send_debug(debug_q, "info", "Session started", {"session_id": session_id})
 
     # Load thread_id once per websocket connection
-    t0 = time.perf_counter()
+    t0 = time.perf_counter_ns()
     ttfc_ms = None
-    thread_id: Optional[str] = await cosmos.get_thread_id(session_id)
-    await send_debug(
-        ws,
+    thread_id: Optional[str] = await _get_cached_thread_id(session_id)
+    cache_hit = thread_id is not None
+    if not cache_hit:
+        thread_id = await store.get_thread_id(session_id)
+        await _cache_thread_id(session_id, thread_id)
+    send_debug(
+        debug_q,
         "info",
         "Cosmos get_thread_id",
         {
             "session_id": session_id,
             "thread_id": thread_id,
-            "ms": int((time.perf_counter() - t0) * 1000),
+            "cached": cache_hit,
+            "ms": (time.perf_counter_ns() - t0) // 1_000_000,
         },
     )
 
     try:
         while True:
-            payload = await ws.receive_json()
+            payload = await _receive_payload(ws)
             user_msg = payload.get("message", "")
 
-            await send_debug(ws, "outgoing", "Client message", {"message": user_msg})
+            send_debug(debug_q, "outgoing", "Client message", {"message": user_msg})
 
             # Respect client streaming preference (payload.streaming: bool)
             streaming = bool(payload.get("streaming", True))
-            t1 = time.perf_counter()
+            t1 = time.perf_counter_ns()
 
-            # Generate unique message ID for this response
-            
-            message_id = str(uuid.uuid4())
+            # Unique message ID for this response
+            msg_seq += 1
+            message_id = f"{conn_id}:{msg_seq}"
 
             answer_text = ""
             new_tid = None
             agent_ms = 0
 
             if streaming:
+                batcher = _ChunkBatcher(ws, message_id)
+                progress_handle: Optional[asyncio.TimerHandle] = None
                 try:
                     # Send stream start
-                    await ws.send_json(jsonable_encoder({
-                        "type": "stream_start",
-                        "message_id": message_id,
-                        "session_id": session_id
-                    }))
+                    await _send_framed(ws, _STREAM_START, message_id, {"session_id": session_id})
 
-                    # Background task to show "Still working..." after 3 seconds
-                    async def _show_progress():
-                        await asyncio.sleep(3.0)
-                        await ws.send_json(jsonable_encoder({
+                    # Show "Still working..." after 3 seconds; a timer handle, not a task,
+                    # so the common case (first chunk in time) is a plain cancel()
+                    progress_handle = asyncio.get_running_loop().call_later(
+                        3.0,
+                        lambda: _spawn(_send(ws, {
                             "type": "status",
                             "message_id": message_id,
                             "status": "Still working..."
-                        }))
-
-                    progress_task = asyncio.create_task(_show_progress())
+                        })),
+                    )
 
-                    stream_result = await ask(
+                    stream_generator: AsyncGenerator[StreamEvent, None] = await ask(
                         user_msg,
                         thread_id=thread_id,
                         reuse_thread=True,
                         stream=True,
                         session_id=session_id,
+                        # thread_id changes are written by the background upsert worker
+                        persist_thread=False,
                     )
-                    stream_generator = cast(AsyncGenerator[dict, None], stream_result)
 
-                    accumulated_text = []
+                    # UTF-8 bytes of the answer so far: one growing buffer instead of a
+                    # list of str chunks. Only the level-3 debug frame echoes the answer,
+                    # so below that nothing is accumulated.
+                    keep_answer = DEBUG_LEVEL >= 3
+                    answer_buf = bytearray()
                     new_tid = None
                     first_chunk = True
 
-                    async for chunk in stream_generator:
-                        if chunk["type"] == "chunk":
-                            content = chunk["content"]
-                            accumulated_text.append(content)
+                    async for kind, content in stream_generator:
+                        if kind == CHUNK:
+                            if keep_answer:
+                                answer_buf += content.encode("utf-8")
+
+                            # Send chunk to client (batched with its neighbours)
+                            await batcher.add(content)
 
-                            # Cancel progress task on first chunk
+                            # Cancel progress timer on first chunk
                             if first_chunk:
-                                progress_task.cancel()
+                                progress_handle.cancel()
                                 first_chunk = False
 
-                                ttfc_ms = int((time.perf_counter() - t1) * 1000)
+                                # Never hold the first chunk back: it sets the perceived TTFC
+                                await batcher.flush()
+                                ttfc_ms = (time.perf_counter_ns() - t1) // 1_000_000
 
-                                await send_debug(ws, "incoming", "Stream First Char", {
+                                send_debug(debug_q, "incoming", "Stream First Char", {
                                     "message_id": message_id,
                                     "session_id": session_id,
                                     "thread_id": thread_id,
                                     "ttfc_ms": ttfc_ms
                                 })
 
-                            # Send chunk to client
-                            await ws.send_json(jsonable_encoder({
-                                "type": "stream_chunk",
-                                "message_id": message_id,
-                                "content": content
-                            }))
+                        elif kind == DONE:
+                            new_tid = content
 
-                        elif chunk["type"] == "done":
-                            new_tid = chunk.get("thread_id")
+                    await batcher.close()
+                    agent_ms = (time.perf_counter_ns() - t1) // 1_000_000
 
-                    agent_ms = int((time.perf_counter() - t1) * 1000)
+                    # No chunks at all: make sure the timer cannot fire after stream_end
+                    progress_handle.cancel()
 
-                    # Clean up progress task
-                    progress_task.cancel()
-                    try:
-                        await progress_task
-                    except asyncio.CancelledError:
-                        pass
-
-                    answer_text = "".join(accumulated_text)
+                    if keep_answer:
+                        answer_text = answer_buf.decode("utf-8")
 
                     # Send stream end with metadata
-                    await ws.send_json(jsonable_encoder({
-                        "type": "stream_end",
-                        "message_id": message_id,
+                    await _send_framed(ws, _STREAM_END, message_id, {
                         "thread_id": new_tid,
                         "timings_ms": {"agent_total_ms": agent_ms}
-                    }))
+                    })
 
                 except Exception as e:
+                    batcher.cancel()
+                    if progress_handle is not None:
+                        progress_handle.cancel()
                     # Send error message to client on stream failure
-                    await send_debug(ws, "error", "Stream error", {"error": str(e), "message_id": message_id})
-                    await ws.send_json(jsonable_encoder({
-                        "type": "stream_error",
-                        "message_id": message_id,
-                        "error": str(e)
-                    }))
+                    err = str(e)
+                    send_debug(debug_q, "error", "Stream error", {"error": err, "message_id": message_id})
+                    await _send_error(ws, message_id, err)
                     continue
 
             else:
@@ -193,54 +468,89 @@ async def ws_endpoint(ws: WebSocket):
                         reuse_thread=True,
                         stream=False,
                         session_id=session_id,
+                        # thread_id changes are written by the background upsert worker
+                        persist_thread=False,
                     )
                     answer_text = resp_text
-                    agent_ms = int((time.perf_counter() - t1) * 1000)
+                    agent_ms = (time.perf_counter_ns() - t1) // 1_000_000
 
                     # Send a single response payload (legacy/non-streaming client)
-                    await ws.send_json(jsonable_encoder({
+                    await _send(ws, {
                         "answer": resp_text,
-                        "agent": "hr_agent",
+                        "agent": AGENT_NAME,
                         "message_id": message_id,
                         "thread_id": new_tid,
                         "timings_ms": {"agent_total_ms": agent_ms}
-                    }))
+                    })
 
                 except Exception as e:
-                    await send_debug(ws, "error", "Non-stream error", {"error": str(e), "message_id": message_id})
-                    await ws.send_json(jsonable_encoder({
-                        "type": "stream_error",
-                        "message_id": message_id,
-                        "error": str(e)
-                    }))
+                    err = str(e)
+                    send_debug(debug_q, "error", "Non-stream error", {"error": err, "message_id": message_id})
+                    await _send_error(ws, message_id, err)
                     continue
 
-            # Persist thread only if missing/changed
+            # Persist thread only if missing/changed; the write happens in the background
             if new_tid and new_tid != thread_id:
-                t2 = time.perf_counter()
-                await cosmos.upsert_thread_id(session_id, new_tid)
-                await send_debug(
-                    ws,
+                upsert_q.put_nowait((session_id, new_tid))
+                await _cache_thread_id(session_id, new_tid)
+                send_debug(
+                    debug_q,
                     "info",
-                    "Cosmos upsert_thread_id",
+                    "Cosmos upsert_thread_id queued",
                     {
                         "session_id": session_id,
                         "thread_id": new_tid,
-                        "ms": int((time.perf_counter() - t2) * 1000),
                     },
                 )
                 thread_id = new_tid
             
-            # Send debug info with complete answer
-            await send_debug(ws, "incoming", "Server response complete", {
-                "message_id": message_id,
-                "answer": answer_text,
-                "agent": "hr_agent",
-                "session_id": session_id,
-                "thread_id": thread_id,
-                "timings_ms": {"agent_total_ms": agent_ms}
-            })
+            # Send debug info with complete answer (checked here so the payload is
+            # not even built when this level is off)
+            if DEBUG_LEVEL >= 3:
+                send_debug(debug_q, "incoming", "Server response complete", {
+                    "message_id": message_id,
+                    "answer": answer_text[:_DEBUG_ANSWER_MAX],
+                    "agent": AGENT_NAME,
+                    "session_id": session_id,
+                    "thread_id": thread_id,
+                    "timings_ms": {"agent_total_ms": agent_ms}
+                }, level=3)
 
     except WebSocketDisconnect:
         # Client closed
         return
+    finally:
+        writer_task.cancel()
+
+
+def main() -> None:
+    """
+    Serving entrypoint (`python -m hr_agent.webapp`): uvloop + httptools, no access log,
+    a single worker unless WEB_CONCURRENCY is set.
+    """
+    import uvicorn
+
+    try:
+        import uvloop  # noqa: F401  (not available on Windows)
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+
+    uvicorn.run(
+        "hr_agent.webapp:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        loop=loop,
+        http="httptools",
+        ws="websockets",
+        # Stream frames are a few tokens each: zlib per frame costs more CPU than it saves
+        ws_per_message_deflate=False,
+        access_log=False,
+        # Each worker warms up its own agent (creating one when FOUNDRY_AGENT_ID is unset)
+        # and keeps its own thread cache, so more than one is opt-in
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
+
+
+if __name__ == "__main__":
+    main()